@@ -1,22 +1,29 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from collections import namedtuple
+from collections import deque, namedtuple
+from operator import attrgetter
 
 import curses
 import curses.panel
+import heapq
+import itertools
 import logging
 import threading
 import time
-from louie import dispatcher, All
-from common.ozwWrapper import ZWaveWrapper
 
-padcoords = namedtuple('padcoords', ['sminrow','smincol','smaxrow','smaxcol'])
 colorlevels = namedtuple('colorlevels', ['error','warning'])
 
+class padcoords(object):
+    '''Screen rectangle a pad is drawn into'''
+    __slots__ = ('sminrow', 'smincol', 'smaxrow', 'smaxcol')
+
+    def __init__(self, sminrow, smincol, smaxrow, smaxcol):
+        self.sminrow, self.smincol, self.smaxrow, self.smaxcol = sminrow, smincol, smaxrow, smaxcol
+
 class ZWaveCommander:
     def __init__(self, stdscr):
-        self._curAlert = False
-        self._alertStack = list()
+        self._alertBusy = threading.Event()
+        self._alertStack = deque()
         self._driverInitialized = False
         self._wrapper = None
         self._listMode = True
@@ -24,9 +31,17 @@ class ZWaveCommander:
         self._version = '0.1 Beta 1'
         self._listtop = 0
         self._listindex = 0
-        self._listcount = 0
         self._selectedNode = None
+        self._sortedNodes = None
+        self._dirtyNodes = False
+        self._dirtyReady = False
+        self._readyNodeCount = 0
+        self._lastReadyNode = None
+        self._coalesceTimerArmed = False
         self._stop = threading.Event()
+        self._timerq = []
+        self._timerseq = itertools.count()
+        self._timerCV = threading.Condition()
         self._keys = {
             'A' : 'Add',
             'B' : 'About',
@@ -45,14 +60,23 @@ class ZWaveCommander:
             'config': '../openzwave/config/',
         }
 
-        # TODO: add log level to config
-        # TODO: add log enable/disable to config
-        # TODO: logging - can ozw log be redirected to file?  If so, we can add ability to view/tail log
-        FORMAT='%(asctime)s\t%(levelname)s\t%(name)s\t%(message)s'
-        logging.basicConfig(filename='test.log', level=logging.DEBUG, format=FORMAT)
         self._log = logging.getLogger('ZWaveCommander')
         self._logbar ='\n%s\n' % ('-'*60)
 
+        self._keymap = dict()
+        for mnemonic, func in self._keys.items():
+            funcname = '_handle%s' % func
+            handler = getattr(self, funcname, None)
+            if handler is None:
+                msg = 'No method named [%s] defined!' % funcname
+                self._log.warn('handleMnemonic: %s', msg)
+                handler = lambda msg=msg: self._alert(msg)
+            self._keymap[ord(mnemonic[0].lower())] = handler
+            self._keymap[ord(mnemonic[0].upper())] = handler
+
+    _sortcolumn = property(lambda self: self._colheaders[self._sortIdx])
+    _detailview = property(lambda self: self._detailheaders[self._detailIdx])
+
     def main(self):
         '''Main run loop'''
         self._log.info('%sZWaveCommander Version %s Starting%s', self._logbar, self._version, self._logbar)
@@ -64,16 +88,38 @@ class ZWaveCommander:
         finally:
             self._shutdown()
 
-    def _delayloop(self, context, duration, callback):
-        self._log.debug('thread %s sleeping...', context)
-        time.sleep(duration)
+    def _waitDeferred(self, timeout):
+        '''Block until the next timer is due, a new timer is set, or timeout seconds pass'''
+        with self._timerCV:
+            if self._timerq:
+                timeout = max(0, min(timeout, self._timerq[0][0] - time.time()))
+            self._timerCV.wait(timeout)
+
+    def _pumpDeferred(self):
+        '''Run every timer whose deadline has passed; called from the UI thread'''
+        now = time.time()
+        due = []
+        with self._timerCV:
+            while self._timerq and self._timerq[0][0] <= now:
+                due.append(heapq.heappop(self._timerq))
+        for deadline, seq, context, callback in due:
+            self._fireTimer(context, callback)
+
+    def _fireTimer(self, context, callback):
         self._log.debug('timer %s expired, executing callback %s', context, callback)
-        if context == 'alert':
-            self._curAlert = False
-            if self._alertStack:
-                self._alert(self._alertStack.pop())
         if callback is not None:
             callback()
+        if context == 'alert':
+            self._alertBusy.clear()
+            if self._alertStack:
+                # show everything queued meanwhile as one alert: latest few distinct messages, oldest first
+                pending = []
+                while self._alertStack:
+                    text = self._alertStack.popleft()
+                    if text in pending:
+                        pending.remove(text)
+                    pending.append(text)
+                self._alert(' | '.join(pending[-3:]))
 
     def _handleQuit(self):
         # TODO: exit confirmation dialog
@@ -107,18 +153,18 @@ class ZWaveCommander:
             self._wrapper.setNodeLevel(self._selectedNode, newLevel)
         
     def _setTimer(self, context, duration, callback):
-        newTimer = threading.Thread(None, self._delayloop, 'cb-thread-%s' % context, (context, duration, callback), {})
-        newTimer.setDaemon(True)
-        newTimer.start()
+        with self._timerCV:
+            heapq.heappush(self._timerq, (time.time() + duration, next(self._timerseq), context, callback))
+            self._timerCV.notify()
 
     def _alert(self, text):
         '''perform program alert'''
-        if not self._curAlert:
-            self._curAlert = True
+        if not self._alertBusy.isSet():
+            self._alertBusy.set()
             curses.flash()
-            self._screen.addstr(self._screensize[0] - 1, 0, ' {0:{width}}'.format(text, width=self._screensize[1] - 2),
-                            curses.color_pair(self.COLOR_ERROR))
-            self._screen.refresh()
+            self._screen.addstr(self._screensize[0] - 1, 0, ' {0:{width}.{width}}'.format(text, width=self._screensize[1] - 2),
+                            self._attrError)
+            self._screen.noutrefresh()
             self._setTimer('alert', 1, self._redrawMenu)
         else:
             self._alertStack.append(text)
@@ -141,10 +187,13 @@ class ZWaveCommander:
         # last three columns: 23 chars: are optional and can fall off if space requires it (min width 45)
         # "min" columns expand evenly to fit remaining space
 
-        self._screen.clear()
+        self._screen.erase()
         self._log.debug("Laying out screen")
         self._colwidths=[1,4,10,10,15,12,8,8]
         self._colheaders=['','ID','Name','Location','Type','State','Batt','Signal']
+        # node attribute each column sorts on; State mixes text and bars so it isn't sortable
+        self._colattrs=[None,'id','name','location','productType',None,'batteryLevel','signalStrength']
+        self._valuecols=[6,7] # Batt, Signal: sort keys that change with node values
         self._detailheaders=['Info','Values','Classes','Groups','Events']
         self._flexcols=[2,3,4]
         self._rowheights=[5,5,10,1]
@@ -153,8 +202,8 @@ class ZWaveCommander:
         self._deviceValueWidths= [10,20,9,6,10,20,10,10]
 
 
-        self._sortcolumn = self._colheaders[1]
-        self._detailview = self._detailheaders[0]
+        self._sortIdx = 1
+        self._detailIdx = 0
 
         self._screensize = self._screen.getmaxyx()
         width = self._screensize[1]
@@ -190,7 +239,9 @@ class ZWaveCommander:
         else:
             self._log.debug('Curses initialized, but no colors are available')
 
-        self._listpad = curses.newpad(256,256)
+        # list rows span every column; the spare cell keeps the cursor on the pad after a full row
+        self._listpadwidth = max(sum(self._colwidths), self._screensize[1]) + 1
+        self._listpad = curses.newpad(64, self._listpadwidth)
         self._detailpads = {
             'Info': curses.newpad(self._rowheights[2], self._screensize[1]),
             'Values': curses.newpad(128, self._screensize[1]),
@@ -205,11 +256,21 @@ class ZWaveCommander:
         self._detailtop = self._rowheights[0] + self._rowheights[1] + 2
         self._detailbottom = self._detailtop + self._rowheights[2] - 3
 
+        # Column widths only change here, so pre-build the fixed-width text used while drawing
+        self._rowFmt = ' ' + ''.join('{%d!s:<%d.%d}' % (i, w, w) for i, w in enumerate(self._colwidths[1:5]))
+        self._hdrCells = ['{0:<{width}}'.format(text, width=wid) for text, wid in zip(self._colheaders, self._colwidths)]
+        self._detailHdrCells = [' {0} '.format(text) for text in self._detailheaders]
+        self._menuItems = [(' {0} '.format(mnemonic), text) for mnemonic, text in self._keys.items()]
+        self._blankMenu = ' ' * (self._screensize[1] - 1)
+        self._blankHdr = ' ' * self._screensize[1]
+
         self._updateColumnHeaders()
 
     def _initCurses(self, stdscr):
         '''Configure ncurses application-specific environment (ncurses has already been initialized)'''
         curses.curs_set(0)
+        # getch returns -1 after 100ms without input so the run loop can service timers
+        stdscr.timeout(100)
 
         # Re-define color attributes...
         self.COLOR_NORMAL=1
@@ -228,6 +289,23 @@ class ZWaveCommander:
         curses.init_pair(self.COLOR_WARN, curses.COLOR_YELLOW, curses.COLOR_BLACK) # warn
         curses.init_pair(self.COLOR_OK, curses.COLOR_GREEN, curses.COLOR_BLACK) # ok
 
+        # ...and cache the attribute combinations used while drawing
+        self._attrNormal = curses.color_pair(self.COLOR_NORMAL)
+        self._attrNormalBold = self._attrNormal | curses.A_BOLD
+        self._attrDim = self._attrNormal | curses.A_DIM
+        self._attrSel = self._attrNormal | curses.A_STANDOUT
+        self._attrSelBold = self._attrSel | curses.A_BOLD
+        self._attrNormalLow = self._attrNormal | curses.A_LOW
+        self._attrSelLow = self._attrSel | curses.A_LOW
+        self._attrHdr = curses.color_pair(self.COLOR_HEADER_NORMAL)
+        self._attrHdrHi = curses.color_pair(self.COLOR_HEADER_HI) | curses.A_BOLD
+        self._attrDialog = curses.color_pair(self.COLOR_HEADER_HI)
+        self._attrError = curses.color_pair(self.COLOR_ERROR)
+        self._attrCritical = curses.color_pair(self.COLOR_CRITICAL)
+        self._attrWarn = curses.color_pair(self.COLOR_WARN)
+        self._attrOk = curses.color_pair(self.COLOR_OK)
+        self._attrOkBold = self._attrOk | curses.A_BOLD
+
         self._layoutScreen()
 
     def _checkConfig(self):
@@ -246,16 +324,49 @@ class ZWaveCommander:
         else:
             self._log.info('OpenZWave initialized successfully.')
 
+    # The _notify* methods are louie receivers and run on the wrapper thread.  ncurses is not
+    # thread-safe, so they only record state and queue timers; drawing happens in _pumpDeferred.
+
     def _notifyDriverReady(self, homeId):
+        self._setTimer('driverReady', 0, lambda: self._processDriverReady(homeId))
+
+    def _processDriverReady(self, homeId):
         self._log.info('OpenZWave Driver is Ready; homeid is %0.8x.  %d nodes were found.', homeId, self._wrapper.nodeCount)
         self._driverInitialized = True
         self._addDialogText(2,'Driver initialized with homeid {0}'.format(hex(homeId)))
         self._addDialogText(3,'Node Count is now {0}'.format(self._wrapper.nodeCount))
-        self._readyNodeCount = 0
 
     def _notifyNodeAdded(self, homeId, nodeId):
-        self._addDialogText(3,'Node Count is now {0}'.format(self._wrapper.nodeCount))
-        self._updateSystemInfo()
+        # nodes tend to arrive in bursts during discovery; repaint once per burst
+        self._dirtyNodes = True
+        self._armNodeFlush()
+
+    def _notifyNodeReady(self, homeId, nodeId):
+        self._readyNodeCount += 1
+        self._lastReadyNode = nodeId
+        self._dirtyReady = True
+        self._armNodeFlush()
+
+    def _armNodeFlush(self):
+        if not self._coalesceTimerArmed:
+            self._coalesceTimerArmed = True
+            self._setTimer('coalesce', 0.05, self._flushNodeUpdates)
+
+    def _flushNodeUpdates(self):
+        self._coalesceTimerArmed = False
+        if not (self._dirtyNodes or self._dirtyReady):
+            return
+        self._sortedNodes = None
+        if self._dirtyNodes:
+            self._dirtyNodes = False
+            self._addDialogText(3,'Node Count is now {0}'.format(self._wrapper.nodeCount))
+            self._updateSystemInfo()
+        if self._dirtyReady:
+            self._dirtyReady = False
+            self._addDialogText(2, 'OpenZWave is querying associated devices')
+            self._addDialogText(3,'Node {0} is now ready'.format(self._lastReadyNode))
+            self._addDialogProgress(5, self._readyNodeCount, self._wrapper.nodeCount)
+        self._updateDeviceList()
 
     def _redrawAll(self):
         self._clearDialog()
@@ -265,91 +376,101 @@ class ZWaveCommander:
         self._updateDeviceDetail()
 
     def _notifySystemReady(self):
+        self._setTimer('systemReady', 0, self._processSystemReady)
+
+    def _processSystemReady(self):
         self._log.info('OpenZWave Initialization Complete.')
         self._alert('OpenZWave Initialization Complete.')
         self._redrawAll()
 
-    def _notifyNodeReady(self, homeId, nodeId):
-        self._readyNodeCount += 1
-        self._addDialogText(2, 'OpenZWave is querying associated devices')
-        self._addDialogText(3,'Node {0} is now ready'.format(nodeId))
-        self._addDialogProgress(5, self._readyNodeCount, self._wrapper.nodeCount)
-        self._updateDeviceList()
-
     def _notifyValueChanged(self, signal, **kw):
         nodeId = kw['nodeId']
+        self._setTimer('valueChanged', 0, lambda: self._processValueChanged(nodeId))
+
+    def _processValueChanged(self, nodeId):
         self._log.debug('Got value changed notification for node {0}'.format(nodeId))
+        if self._sortIdx in self._valuecols:
+            self._sortedNodes = None
         # TODO: this is very heavy handed - just update appropriate elements
         self._updateDeviceList()
         self._updateDeviceDetail()
 
     def _initDialog(self, height, width, buttons=('OK',), caption=None):
         self._dialogpad = curses.newpad(height, width)
-        self._dialogpad.bkgd(0x94, curses.color_pair(self.COLOR_HEADER_HI))
-        self._dialogpad.clear()
+        self._dialogpad.bkgd(0x94, self._attrDialog)
+        self._dialogpad.erase()
         self._dialogpad.box()
         if caption:
-           lh = (width / 2) - (len(caption) / 2) - 1
-           self._dialogpad.addstr(0, lh, ' {0} '.format(caption), curses.color_pair(self.COLOR_NORMAL) | curses.A_STANDOUT)
+           lh = (width // 2) - (len(caption) // 2) - 1
+           self._dialogpad.addstr(0, lh, ' {0} '.format(caption), self._attrSel)
         if buttons:
             if len(buttons) > 1:
                 bwid = 0
                 for bcap in buttons:
                     if len(bcap) > bwid: bwid = len(bcap)
-                cellwid = (width - 4) / len(buttons)
-                lpad = (cellwid - bwid) / 2 - 1
+                cellwid = (width - 4) // len(buttons)
+                lpad = (cellwid - bwid) // 2 - 1
                 rpad = cellwid - bwid - lpad - 1
                 self._dialogpad.move(height - 2, 1)
             else:
                 bwid = len(buttons[0])
                 lpad = rpad = 1
-                self._dialogpad.move(height - 2, (width / 2) - (bwid / 2) - 2)
+                self._dialogpad.move(height - 2, (width // 2) - (bwid // 2) - 2)
             for button in buttons:
                 self._dialogpad.addstr('{0:{wlpad}}<{1:^{wbwid}}>{0:{wrpad}}'.format('',button, wlpad=lpad, wbwid=bwid, wrpad=rpad))
-        dt = (self._screensize[0] / 2) - (height / 2)
-        dl = (self._screensize[1] / 2) - (width / 2)
+        dt = (self._screensize[0] // 2) - (height // 2)
+        dl = (self._screensize[1] // 2) - (width // 2)
         dc = padcoords(sminrow=dt,smincol=dl,smaxrow=dt+height - 1, smaxcol=dl+width - 1)
         self._dialogcoords = dc
+        # pad-relative geometry reused by _addDialogText/_addDialogProgress
+        self._dialogCenterX = (width - 1) // 2
+        self._dialogTextWidth = width - 2
+        self._dialogBarWidth = (width - 1) * 2 // 3
         self._dialogpad.overlay(self._screen, 0, 0, dc.sminrow, dc.smincol, dc.smaxrow, dc.smaxcol)
-        self._screen.refresh()
+        self._screen.noutrefresh()
 
     def _clearDialog(self):
+        dc = self._dialogcoords
         del self._dialogpad
         self._dialogpad = None
         self._dialogcoords = None
-        self._screen.touchwin()
-        self._screen.refresh()
+        # only the rows the dialog covered need to be repainted from the screen
+        if dc:
+            self._screen.touchline(dc.sminrow, dc.smaxrow - dc.sminrow + 1)
+        self._screen.noutrefresh()
 
     def _updateDialog(self):
         if self._dialogpad:
-            self._screen.refresh()
+            self._screen.noutrefresh()
             dc = self._dialogcoords
-            self._dialogpad.refresh(0,0,dc.sminrow, dc.smincol, dc.smaxrow, dc.smaxcol)
+            self._dialogpad.noutrefresh(0,0,dc.sminrow, dc.smincol, dc.smaxrow, dc.smaxcol)
 
     def _addDialogText(self, row, text, align='^'):
         if self._dialogpad:
-            self._dialogpad.addstr(row, 1, '{0:{aln}{wid}}'.format(text, aln=align, wid=self._dialogpad.getmaxyx()[1] - 2))
+            self._dialogpad.addstr(row, 1, '{0:{aln}{wid}}'.format(text, aln=align, wid=self._dialogTextWidth))
             self._updateDialog()
 
     def _addDialogProgress(self, row, current, total, showPercent=True, width=None):
         if self._dialogpad:
-            dc = self._dialogcoords
             if width is None:
-                width = (dc.smaxcol - dc.smincol) * 2 / 3
+                width = self._dialogBarWidth
             pct = float(current) / float(total)
             filled = int(pct * float(width))
-            lh = ((dc.smaxcol - dc.smincol) / 2) - (width / 2)
-            self._dialogpad.addch(row, lh - 1, '[', curses.color_pair(self.COLOR_NORMAL) | curses.A_BOLD)
-            self._dialogpad.addch(row, lh + width, ']', curses.color_pair(self.COLOR_NORMAL) | curses.A_BOLD)
-            self._dialogpad.addstr(row, lh, ' '*width, curses.color_pair(self.COLOR_NORMAL))
-            self._dialogpad.addstr(row, lh, '|'*filled, curses.color_pair(self.COLOR_OK) | curses.A_BOLD)
+            lh = self._dialogCenterX - (width // 2)
+            self._dialogpad.addch(row, lh - 1, '[', self._attrNormalBold)
+            self._dialogpad.addch(row, lh + width, ']', self._attrNormalBold)
+            self._dialogpad.addstr(row, lh, ' '*width, self._attrNormal)
+            self._dialogpad.addstr(row, lh, '|'*filled, self._attrOkBold)
             if showPercent:
                 pctstr = '{0:4.0%}'.format(pct)
-                lh = ((dc.smaxcol - dc.smincol) / 2) - (len(pctstr) / 2)
-                self._dialogpad.addstr(row, lh, pctstr, curses.color_pair(self.COLOR_NORMAL) | curses.A_BOLD)
+                lh = self._dialogCenterX - (len(pctstr) // 2)
+                self._dialogpad.addstr(row, lh, pctstr, self._attrNormalBold)
             self._updateDialog()
 
     def _checkInterface(self):
+        # deferred so importing this module doesn't pull in louie/openzwave
+        from louie import dispatcher
+        from common.ozwWrapper import ZWaveWrapper
         dispatcher.connect(self._notifyDriverReady, ZWaveWrapper.SIGNAL_DRIVER_READY)
         dispatcher.connect(self._notifySystemReady, ZWaveWrapper.SIGNAL_SYSTEM_READY)
         dispatcher.connect(self._notifyNodeReady, ZWaveWrapper.SIGNAL_NODE_READY)
@@ -357,37 +478,35 @@ class ZWaveCommander:
         dispatcher.connect(self._notifyNodeAdded, ZWaveWrapper.SIGNAL_NODE_ADDED)
         self._initDialog(10,60,['Cancel'],'Progress')
         self._addDialogText(2,'Initializing OpenZWave')
+        curses.doupdate()
         self._log.info('Initializing OpenZWave via wrapper')
         self._wrapper = ZWaveWrapper.getInstance(device=self._config['device'], config=self._config['config'], log=None)
         self._setTimer('initCheck', 3, self._checkIfInitialized)
 
+        # wrapper.initialized flips just before SYSTEM_READY, whose queued timer wakes the wait
         while not self._stop.isSet() and not self._wrapper.initialized:
-            time.sleep(0.1)
+            self._waitDeferred(0.5)
+            self._pumpDeferred()
+            curses.doupdate()
             # TODO: handle keys here... cancel/etc
 
     def _runLoop(self):
-        while not self._stop.isSet():   
+        while not self._stop.isSet():
             key = self._screen.getch()
             if key == curses.KEY_DOWN: self._switchItem(1)
             elif key == curses.KEY_UP: self._switchItem(-1)
             elif key == curses.KEY_LEFT: self._switchTab(-1)
             elif key == curses.KEY_RIGHT: self._switchTab(1)
             elif key == 0x09: self._nextMode()
-            elif key is not None: self._handleMnemonic(key)
+            elif key != -1: self._handleMnemonic(key)
+            # service due timers on every pass (not just on getch timeouts) so held keys can't starve them
+            self._pumpDeferred()
+            curses.doupdate()
 
     def _handleMnemonic(self, key):
-        for mnemonic, func in self._keys.iteritems():
-            if key == ord(mnemonic[0].lower()) or key == ord(mnemonic[0].upper()):
-                funcname = '_handle%s' % func
-                try:
-                    method = getattr(self, funcname)
-                    method()
-                except AttributeError as ex:
-                    msg = 'No method named [%s] defined!' % funcname
-                    self._log.warn('handleMnemonic: %s', msg)
-                    self._log.warn('handleMnemonic Exception Details: %s', str(ex))
-                    self._alert(msg)
-                break
+        handler = self._keymap.get(key)
+        if handler:
+            handler()
 
     def _resetDetailPos(self):
         for p in self._detailpos.iterkeys():
@@ -395,29 +514,46 @@ class ZWaveCommander:
 
     def _switchItem(self, delta):
         if self._listMode:
+            nodes = self._sortedNodes
+            stale = self._isListStale(nodes)
+            if stale:
+                # rebuilding moves _listindex to wherever the selected node now sits
+                nodes = self._getListNodes()
             n = self._listindex + delta
-            if n in range(0, self._listcount):
-                self._listindex = n
-                self._updateDeviceList() # TODO: we don't really need to redraw everything when selection changes
+            if 0 <= n < len(nodes):
+                if stale:
+                    # order or pad changed underneath us; repaint the whole list
+                    self._listindex = n
+                    self._updateDeviceList()
+                else:
+                    # only the previous and new selection rows change
+                    self._drawRows(((self._listindex, nodes[self._listindex], False), (n, nodes[n], True)))
+                    self._listindex = n
+                    self._selectedNode = nodes[n]
+                    self._refreshDeviceList()
                 self._resetDetailPos()
                 self._updateDeviceDetail()
+            elif stale:
+                self._updateDeviceList()
         else:
             self._detailpos[self._detailview] += delta
             self._updateDeviceDetail()
 
     def _switchTab(self, delta):
         if self._listMode:
-            i = self._colheaders.index(self._sortcolumn)
-            i += delta
-            if i > len(self._colheaders) - 1: i = 1
-            elif i < 1: i = len(self._colheaders) - 1
-            self._sortcolumn = self._colheaders[i]
+            i = self._sortIdx
+            while True:
+                i += delta
+                if i > len(self._colheaders) - 1: i = 1
+                elif i < 1: i = len(self._colheaders) - 1
+                if self._colattrs[i]: break
+            self._sortIdx = i
+            self._sortedNodes = None
         else:
-            i = self._detailheaders.index(self._detailview)
-            i += delta
+            i = self._detailIdx + delta
             if i > len(self._detailheaders) - 1: i = 0
             elif i < 0: i = len(self._detailheaders) - 1
-            self._detailview = self._detailheaders[i]
+            self._detailIdx = i
         self._updateColumnHeaders()
         self._updateDeviceList()
         self._updateDeviceDetail()
@@ -428,44 +564,42 @@ class ZWaveCommander:
 
     def _shutdown(self):
         # TODO: handle orderly shutdown
-        pass
+        self._stop.set()
 
     def _rightPrint(self, row, data, attrs=None):
         if attrs is None:
-            attrs = curses.color_pair(self.COLOR_NORMAL)
+            attrs = self._attrNormal
         self._screen.addstr(row, self._screensize[1] - len(data), data, attrs)
 
     def _updateSystemInfo(self):
-        self._screen.addstr(0,1,'{0} on {1}'.format(self._wrapper.controllerDescription, self._config['device']), curses.color_pair(self.COLOR_NORMAL))
-        self._screen.addstr(1,1,'Home ID 0x%0.8x' % self._wrapper.homeId, curses.color_pair(self.COLOR_NORMAL))
+        self._screen.addstr(0,1,'{0} on {1}'.format(self._wrapper.controllerDescription, self._config['device']), self._attrNormal)
+        self._screen.addstr(1,1,'Home ID 0x%0.8x' % self._wrapper.homeId, self._attrNormal)
         self._screen.move(2,1)
-        self._screen.addstr('{0} Registered Nodes'.format(self._wrapper.nodeCount), curses.color_pair(self.COLOR_NORMAL))
+        self._screen.addstr('{0} Registered Nodes'.format(self._wrapper.nodeCount), self._attrNormal)
         if self._wrapper.initialized:
             sleepcount = self._wrapper.sleepingNodeCount
             if sleepcount:
-                self._screen.addstr(' ({0} Sleeping)'.format(sleepcount),curses.color_pair(self.COLOR_NORMAL) | curses.A_DIM)
+                self._screen.addstr(' ({0} Sleeping)'.format(sleepcount),self._attrDim)
         self._rightPrint(0, '{0} Library'.format(self._wrapper.libraryTypeName))
         self._rightPrint(1, 'Version {0}'.format(self._wrapper.libraryVersion))
-        self._screen.refresh()
+        self._screen.noutrefresh()
 
     def _updateColumnHeaders(self):
+        addstr = self._screen.addstr
+        hi = self._attrHdrHi
         self._screen.move(4,0)
-        for text, wid in zip(self._colheaders, self._colwidths):
-            clr = curses.color_pair(self.COLOR_HEADER_NORMAL) if self._listMode else curses.color_pair(self.COLOR_NORMAL) | curses.A_STANDOUT
-            if text == self._sortcolumn:
-                clr = curses.color_pair(self.COLOR_HEADER_HI) | curses.A_BOLD
-            self._screen.addstr('{0:<{width}}'.format(text, width=wid), clr)
+        clr = self._attrHdr if self._listMode else self._attrSel
+        sortIdx = self._sortIdx
+        for i, cell in enumerate(self._hdrCells):
+            addstr(cell, hi if i == sortIdx else clr)
 
         self._screen.move(self._rowheights[0] + self._rowheights[1] + 1, 0)
-        clr = curses.color_pair(self.COLOR_HEADER_NORMAL) if not self._listMode else curses.color_pair(self.COLOR_NORMAL) | curses.A_STANDOUT
-        self._screen.addstr('{0:{width}}'.format('', width=self._screensize[1]), clr)
+        clr = self._attrHdr if not self._listMode else self._attrSel
+        addstr(self._blankHdr, clr)
         self._screen.move(self._rowheights[0] + self._rowheights[1] + 1, 0)
-        for text in self._detailheaders:
-            clr = curses.color_pair(self.COLOR_HEADER_NORMAL) if not self._listMode else curses.color_pair(self.COLOR_NORMAL) | curses.A_STANDOUT
-            if text == self._detailview:
-                clr = curses.color_pair(self.COLOR_HEADER_HI) | curses.A_BOLD
-            wid = len(text)
-            self._screen.addstr(' {0:<{width}} '.format(text, width=wid), clr)
+        detailIdx = self._detailIdx
+        for i, cell in enumerate(self._detailHdrCells):
+            addstr(cell, hi if i == detailIdx else clr)
 
     def _fixColumn(self, text, width, align='<'):
         retval = '{0:{aln}{wid}}'.format(text, aln=align, wid=width)
@@ -474,91 +608,114 @@ class ZWaveCommander:
         return retval
         
     def _getListItemColor(self, drawSelected):
-        return curses.color_pair(self.COLOR_NORMAL) | curses.A_STANDOUT if drawSelected \
-            else curses.color_pair(self.COLOR_NORMAL)
+        return self._attrSel if drawSelected else self._attrNormal
 
-    def _drawMiniBar(self, value, minValue, maxValue, drawWidth, drawSelected, drawPercent=False, colorLevels=None):
-        clr = self._getListItemColor(drawSelected)
+    def _drawMiniBar(self, pad, value, minValue, maxValue, drawWidth, drawSelected, drawPercent=False, colorLevels=None):
+        clr = self._attrSel if drawSelected else self._attrNormal
+        bold = self._attrSelBold if drawSelected else self._attrNormalBold
         pct = float(value) / float(maxValue)
         dw = drawWidth - 2
         filled = int(pct * float(dw))
         fillcolor = clr
         if not drawSelected:
-            fillcolor = curses.color_pair(self.COLOR_OK)
+            fillcolor = self._attrOk
             if colorLevels:
                 if pct <= colorLevels.error:
-                    fillcolor = curses.color_pair(self.COLOR_CRITICAL)
+                    fillcolor = self._attrCritical
                 elif pct <= colorLevels.warning:
-                    fillcolor = curses.color_pair(self.COLOR_WARN)
+                    fillcolor = self._attrWarn
 
-        self._listpad.addch('[', clr | curses.A_BOLD)
-        self._listpad.addstr('|' * filled, fillcolor)
-        self._listpad.addstr(' ' * (dw - filled), clr)
-        self._listpad.addch(']', clr | curses.A_BOLD)
+        pad.addch('[', bold)
+        pad.addstr('|' * filled, fillcolor)
+        pad.addstr(' ' * (dw - filled), clr)
+        pad.addch(']', bold)
         # TODO: draw percent text if requested
 
-    def _drawNodeStatus(self, node, drawSelected):
-        clr = self._getListItemColor(drawSelected)
-        if node.isSleeping:
-            self._listpad.addstr(self._fixColumn('(sleeping)', self._colwidths[5]), clr | curses.A_LOW)
-        elif node.hasCommandClass(0x76): # lock
-            self._listpad.addstr(self._fixColumn('Locked' if node.isLocked else 'Unlocked', self._colwidths[5]), clr)
-        elif node.hasCommandClass(0x26): # multi-level switch
-            self._drawMiniBar(node.level, 0, 99, self._colwidths[5], drawSelected)
-        elif node.hasCommandClass(0x25): # binary switch
-            self._listpad.addstr(self._fixColumn('ON' if node.isOn else 'OFF', self._colwidths[5]), clr)
-        else:
-            self._listpad.addstr(self._fixColumn('OK', self._colwidths[5]), clr)
-
-    def _drawBatteryStatus(self, node, drawSelected):
-        clr = self._getListItemColor(drawSelected)
-        if node.hasCommandClass(0x80):
-            self._drawMiniBar(node.batteryLevel, 0, 100, self._colwidths[6], drawSelected, colorLevels=colorlevels(error=0.10,warning=0.40))
-        else:
-            self._listpad.addstr(self._fixColumn('', self._colwidths[6]), clr)
-
-    def _drawSignalStrength(self, node, drawSelected):
-        clr = self._getListItemColor(drawSelected)
-        self._listpad.addstr(self._fixColumn('', self._colwidths[7]), clr)
-        
-    def _drawDeviceNodeLine(self, node, drawSelected):
-        clr = self._getListItemColor(drawSelected)
-        self._listpad.addstr(' ', clr)
-        self._listpad.addstr(self._fixColumn(node.id, self._colwidths[1]), clr)
-        self._listpad.addstr(self._fixColumn(node.name, self._colwidths[2]), clr)
-        self._listpad.addstr(self._fixColumn(node.location, self._colwidths[3]), clr)
-        self._listpad.addstr(self._fixColumn(node.productType, self._colwidths[4]), clr)
-        self._drawNodeStatus(node, drawSelected)
-        self._drawBatteryStatus(node, drawSelected)
-        self._drawSignalStrength(node, drawSelected)
+    def _sortKeyFn(self):
+        return attrgetter(self._colattrs[self._sortIdx])
+
+    def _isListStale(self, nodes):
+        '''True if the given snapshot of _sortedNodes has been invalidated or no longer covers every node'''
+        return nodes is None or len(nodes) != self._wrapper.nodeCount
+
+    def _getListNodes(self):
+        nodes = self._sortedNodes
+        if self._isListStale(nodes):
+            # build from an explicit copy of the dict's values (a view on Python 3), then sort the copy
+            nodes = list(self._wrapper._nodes.values())
+            nodes.sort(key=self._sortKeyFn())
+            self._sortedNodes = nodes
+            # keep the selection on the same device, not the same row
+            if self._selectedNode in nodes:
+                self._listindex = nodes.index(self._selectedNode)
+            if len(nodes) >= self._listpad.getmaxyx()[0]:
+                del self._listpad
+                self._listpad = curses.newpad(len(nodes) * 2, self._listpadwidth)
+        return nodes
+
+    def _drawRows(self, rows):
+        '''Draw (index, node, selected) rows into the list pad'''
+        pad = self._listpad
+        move = pad.move
+        addstr = pad.addstr
+        drawMiniBar = self._drawMiniBar
+        rowFmt = self._rowFmt
+        stateWid, battWid, sigWid = self._colwidths[5:8]
+        stateFmt = '{0:<%d.%d}' % (stateWid, stateWid)
+        blankBatt = ' ' * battWid
+        blankSig = ' ' * sigWid
+        sel, normal = self._attrSel, self._attrNormal
+        selLow, normalLow = self._attrSelLow, self._attrNormalLow
+        battLevels = colorlevels(error=0.10,warning=0.40)
+        for idx, node, selected in rows:
+            clr = sel if selected else normal
+            move(idx, 0)
+            addstr(rowFmt.format(node.id, node.name, node.location, node.productType), clr)
+            # state
+            if node.isSleeping:
+                addstr(stateFmt.format('(sleeping)'), selLow if selected else normalLow)
+            elif node.hasCommandClass(0x76): # lock
+                addstr(stateFmt.format('Locked' if node.isLocked else 'Unlocked'), clr)
+            elif node.hasCommandClass(0x26): # multi-level switch
+                drawMiniBar(pad, node.level, 0, 99, stateWid, selected)
+            elif node.hasCommandClass(0x25): # binary switch
+                addstr(stateFmt.format('ON' if node.isOn else 'OFF'), clr)
+            else:
+                addstr(stateFmt.format('OK'), clr)
+            # battery
+            if node.hasCommandClass(0x80):
+                drawMiniBar(pad, node.batteryLevel, 0, 100, battWid, selected, colorLevels=battLevels)
+            else:
+                addstr(blankBatt, clr)
+            # signal
+            addstr(blankSig, clr)
 
     def _updateDeviceList(self):
-        self._listcount = self._wrapper.nodeCount
-        idx = 0
-        for node in self._wrapper._nodes.itervalues():
-            if idx == self._listindex:
-                self._selectedNode = node
-            self._listpad.move(idx,0)
-            self._drawDeviceNodeLine(node, idx == self._listindex)
-            idx += 1
-
+        nodes = self._getListNodes()
+        selidx = self._listindex
+        self._drawRows((idx, node, idx == selidx) for idx, node in enumerate(nodes))
+        if selidx < len(nodes):
+            self._selectedNode = nodes[selidx]
+        self._refreshDeviceList()
+
+    def _refreshDeviceList(self):
         ctop = self._rowheights[0]
         listheight = self._rowheights[1]
         if self._listindex - self._listtop > listheight:
             self._listtop = self._listindex - listheight
         elif self._listindex < self._listtop:
             self._listtop = self._listindex
-        self._screen.refresh()
-        self._listpad.refresh(self._listtop, 0, ctop, 0, ctop + listheight, self._screensize[1] - 1)
+        self._screen.noutrefresh()
+        self._listpad.noutrefresh(self._listtop, 0, ctop, 0, ctop + listheight, self._screensize[1] - 1)
         self._updateDialog()
 
     def _redrawDetailTab(self, pad):
-        self._screen.refresh()
-        pad.refresh(0, 0, self._detailtop, 0, self._detailbottom, self._screensize[1] - 1)
+        self._screen.noutrefresh()
+        pad.noutrefresh(0, 0, self._detailtop, 0, self._detailbottom, self._screensize[1] - 1)
 
     def _updateDetail_Values(self, pad):
         # Draw column header
-        clr = curses.color_pair(self.COLOR_HEADER_HI) | curses.A_BOLD
+        clr = self._attrHdrHi
         pad.addstr(0,0,'{0:<{width}}'.format(' ', width=self._screensize[1]), clr)
         pad.move(0,1)
         for text, wid in zip(self._deviceValueColumns, self._deviceValueWidths):
@@ -574,13 +731,15 @@ class ZWaveCommander:
             s = sorted(sorted(sorted(vset, key=lambda value: value.getValue('index')),
                               key=lambda value: value.getValue('instance')), key=lambda value: value.getValue('commandClass'))
 
-            if self._detailpos[self._detailview] >= len(s): self._detailpos[self._detailview]=len(s)-1
+            view = self._detailview
+            if self._detailpos[view] >= len(s): self._detailpos[view]=len(s)-1
+            pos = self._detailpos[view]
             i = 0
             for value in s:
                 vdic = value.valueData
                 pad.move(i+1,0)
                 # TODO: reset detail position on parent item change
-                drawSelected = self._detailpos['Values'] == i
+                drawSelected = pos == i
                 clr = self._getListItemColor(drawSelected)
                 pad.addstr(' ' * self._screensize[1], clr)
                 pad.move(i+1,1)
@@ -601,7 +760,7 @@ class ZWaveCommander:
 
                     # Draw editable items differently
                     if key == 'value' and not vdic['readOnly'] and drawSelected:
-                        clr = curses.color_pair(self.COLOR_ERROR)
+                        clr = self._attrError
                     pad.addstr(self._fixColumn(text, wid), clr)
 
     def _updateDetail_Info(self, pad):
@@ -609,21 +768,23 @@ class ZWaveCommander:
         if node:
             #baudRate, basic, generic, specific, version, security
             self._deviceInfoColumns=['id','name','location','capabilities','neighbors','manufacturer','product','productType']
-            if self._detailpos[self._detailview] >= len(self._deviceInfoColumns): self._detailpos[self._detailview]=len(self._deviceInfoColumns)-1
+            view = self._detailview
+            if self._detailpos[view] >= len(self._deviceInfoColumns): self._detailpos[view]=len(self._deviceInfoColumns)-1
+            pos = self._detailpos[view]
             editableColumns=['name','location','manufacturer','product']
             i = maxwid = 0
             for name in self._deviceInfoColumns: maxwid = len(name) if len(name) > maxwid else maxwid
             colwidth = maxwid + 2
             clr = self._getListItemColor(False)
-            clr_rw = curses.color_pair(self.COLOR_ERROR)
+            clr_rw = self._attrError
             clr_ro = self._getListItemColor(True)
-            clr_col = curses.color_pair(self.COLOR_OK)
+            clr_col = self._attrOk
             # TODO: If editable, should be textpad
             for column in self._deviceInfoColumns:
                 val = str(getattr(node, column))
                 pad.move(i + 1, 1)
                 pad.addstr('{0:>{width}}'.format(column.title() + ':', width=colwidth), clr_col)
-                selected = i == self._detailpos[self._detailview]
+                selected = i == pos
                 thisclr = clr
                 if selected: thisclr = clr_rw if column in editableColumns else clr_ro
                 i += 1
@@ -631,15 +792,17 @@ class ZWaveCommander:
                 pad.addstr('{0:<{width}}'.format(val, width=30), thisclr)
 
     def _updateDetail_Classes(self, pad):
-        clr = curses.color_pair(self.COLOR_HEADER_HI) | curses.A_BOLD
+        clr = self._attrHdrHi
         pad.addstr(0,0,'{0:<{width}}'.format(' CommandClass', width=self._screensize[1]), clr)
         node = self._selectedNode
         if node:
-            if self._detailpos[self._detailview] >= len(node.commandClasses): self._detailpos[self._detailview]=len(node.commandClasses)-1
+            view = self._detailview
+            if self._detailpos[view] >= len(node.commandClasses): self._detailpos[view]=len(node.commandClasses)-1
+            pos = self._detailpos[view]
             i = 0
             for cc in node.commandClasses:
                 pad.addstr(i + 1, 0, ' {0:<{width}}'.format(self._wrapper.getCommandClassName(cc), width=30),
-                           self._getListItemColor(i == self._detailpos[self._detailview]))
+                           self._getListItemColor(i == pos))
                 i += 1
 
     def _updateDetail_Groups(self, pad):
@@ -656,11 +819,12 @@ class ZWaveCommander:
 
     def _updateDeviceDetail(self):
         # TODO: detail needs to be scrollable, but to accomplish that a couple of changes need to be made.  First, the detail header band needs to be moved into a static shared section (above the detail pad); second, a new dict of 'top' positions needs to be created; finally, positioning code needs to be written to correctly offset the pad.
-        pad = self._detailpads[self._detailview]
-        pad.clear()
-        if self._detailpos[self._detailview] < 0: self._detailpos[self._detailview]=0
+        view = self._detailview
+        pad = self._detailpads[view]
+        pad.erase()
+        if self._detailpos[view] < 0: self._detailpos[view]=0
 
-        funcname = '_updateDetail_{0}'.format(self._detailview)
+        funcname = '_updateDetail_{0}'.format(view)
         try:
             method = getattr(self, funcname)
             method(pad)
@@ -674,22 +838,31 @@ class ZWaveCommander:
 
     def _updateMenu(self):
         menurow = self._screensize[0] - 1
-        self._screen.addstr(menurow, 0, ' ' * (self._screensize[1] - 1), curses.color_pair(self.COLOR_HEADER_NORMAL))
+        self._screen.addstr(menurow, 0, self._blankMenu, self._attrHdr)
         self._screen.move(menurow,4)
-        for mnemonic, text in self._keys.iteritems():
-            self._screen.addstr(' {0} '.format(mnemonic), curses.color_pair(self.COLOR_NORMAL) | curses.A_BOLD)
-            self._screen.addstr('{0}'.format(text), curses.color_pair(self.COLOR_HEADER_NORMAL))
+        addstr = self._screen.addstr
+        bold = self._attrNormalBold
+        hdr = self._attrHdr
+        for mnemonic, text in self._menuItems:
+            addstr(mnemonic, bold)
+            addstr(text, hdr)
 
     def _redrawMenu(self):
         self._updateMenu()
-        self._screen.refresh()
+        self._screen.noutrefresh()
 
 def main(stdscr):
     # TODO: prune log file
+    # TODO: add log level to config
+    # TODO: add log enable/disable to config
+    # TODO: logging - can ozw log be redirected to file?  If so, we can add ability to view/tail log
+    FORMAT='%(asctime)s\t%(levelname)s\t%(name)s\t%(message)s'
+    logging.basicConfig(filename='test.log', level=logging.DEBUG, format=FORMAT)
     commander = ZWaveCommander(stdscr)
     commander.main()
-    
-curses.wrapper(main)
+
+if __name__ == '__main__':
+    curses.wrapper(main)
 
 class DeleteMe:
     '''